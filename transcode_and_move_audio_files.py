@@ -14,33 +14,79 @@
 # -------------------------------------------------------------------------------
 
 import argparse
+import atexit
+import concurrent.futures
+import ctypes
+import dataclasses
+import enum
+import errno
+import functools
 import logging
+import logging.handlers
 import os
-import pathlib
 import platform
+import queue
 import shlex
 import shutil
 import subprocess
 import sys
+import threading
 import time
-import math
 
 from shlex import quote
 from contextlib import suppress
 
 
+# The platform we run on does not change during a run, so look it up just the once
+_SYSTEM = platform.system()
+_IS_WINDOWS = _SYSTEM == "Windows"
+_IS_LINUX = _SYSTEM == "Linux"
+
+
+# What to transcode the source files with, if at all. NONE is falsy, so "if transcode:"
+# reads as whether files are to be transcoded.
+class ModeTranscode(enum.IntEnum):
+	NONE = 0
+	ENCODE = 1
+	DECODE = 2
+
+
+# Statistics of a run to present at exit. An instance is passed down to whatever accounts
+# for the files processed, and is only ever updated from the main thread.
+@dataclasses.dataclass
+class RunStats:
+	# Files transcoded, and the total time taken to transcode them
+	count_transcoded: int = 0
+	time_ns_transcode: int = 0
+	# Files lined up for transcoding, and the percentage of completion last reported. These
+	# stay untouched unless the percentage is to be reported.
+	count_transcode_queued: int = 0
+	percent_complete_reported: int = -1
+	# Files moved and copied to the target, the size of the data, and the time taken
+	count_moved: int = 0
+	count_copied: int = 0
+	size_relocated: int = 0
+	time_ns_relocate: int = 0
+
+
+# Return the notifier for balloon tips on Windows. Importing win10toast pulls in pywin32,
+# so it is put off till the first toast is due, and the notifier is re-used after.
+@functools.lru_cache(maxsize = 1)
+def toaster_get():
+	from win10toast import ToastNotifier
+
+	return ToastNotifier()
+
+
 # Show tool tip/notification/toast message
 def show_toast(tooltip_title, tooltip_message):
 	# Handle tool tip notification (Linux)/balloon tip (Windows; only OS v10 supported for now)
 	tooltip_message = os.path.basename(__file__) + ": " + tooltip_message
 
-	if platform.system() == "Linux":
+	if _IS_LINUX:
 		os.system("notify-send \"" + tooltip_title + "\" \"" + tooltip_message + "\"")
 	else:
-		from win10toast import ToastNotifier
-
-		toaster = ToastNotifier()
-		toaster.show_toast(tooltip_title, tooltip_message, icon_path = None, duration = 5)
+		toaster_get().show_toast(tooltip_title, tooltip_message, icon_path = None, duration = 5)
 
 
 # Return the platform specific dictionary having command line transcode tools and
@@ -49,8 +95,11 @@ def show_toast(tooltip_title, tooltip_message):
 # dict_transcode_tool[format][0] refers to the transoder
 # dict_transcode_tool[format][1] refers to the transcoder's options.
 #
+# The dictionaries are built once per operation, and cached for the calls after.
+#
 # TODO: Implement more target formats like ogg in the future.
-def dict_transcode_tool_platform_get(operation_transcode = "encode"):
+@functools.lru_cache(maxsize = 2)
+def dict_transcode_tool_platform_get(operation_transcode = ModeTranscode.ENCODE):
 	opus = "opus"
 	flac = "flac"
 
@@ -61,17 +110,17 @@ def dict_transcode_tool_platform_get(operation_transcode = "encode"):
 	# list for valid source formats for specific targets.
 	valid_encode_source_for_opus = ("wav", "aiff", "flac", "oga", "pcm")
 	valid_encode_target_for_opus_source = opus
-	valid_decode_source_for_opus = opus
+	valid_decode_source_for_opus = (opus,)
 	valid_decode_target_for_opus = "wav"
 
 	# Not all formats can be converted to the target by flac. Hence, we have this list
 	# for valid source formats for specific targets.
 	valid_encode_source_for_flac = ("wav", "aiff", "rf64", "w64")
 	valid_encode_target_for_flac_source = flac
-	valid_decode_source_for_flac = flac
+	valid_decode_source_for_flac = (flac,)
 	valid_decode_target_for_flac = "wav"
 
-	if operation_transcode == "encode":
+	if operation_transcode is ModeTranscode.ENCODE:
 		dict_valid_source = {
 			opus: valid_encode_source_for_opus,
 			flac: valid_encode_source_for_flac
@@ -100,12 +149,13 @@ def dict_transcode_tool_platform_get(operation_transcode = "encode"):
 	# Options for the Opus decoder; none provided by opusdec except --quiet, which we don't want to use
 	options_decode_opus = ()
 
-	# Options for the flac binary
+	# Options for the flac binary. The target file is claimed (created empty) before the transcoder
+	# is run, so have flac overwrite it like opusenc and opusdec do.
 	# options_flac = ("--keep-foreign-metadata", "--replay-gain", "--mid-side", "--best", "--verify", "--")
 	options_encode_flac = (
-		"--keep-foreign-metadata", "--replay-gain", "--mid-side", "--best", "--verify", "--output-name")
+		"--keep-foreign-metadata", "--replay-gain", "--mid-side", "--best", "--verify", "--force", "--output-name")
 	# --keep-foreign-metadata refuses to decode if there's no foreign metadata, so removing the option
-	options_decode_flac = ("--decode", "--output-name")
+	options_decode_flac = ("--decode", "--force", "--output-name")
 
 	# Point to encoding binaries on Windows for supported formats
 	dict_encode_tool_windows = {
@@ -131,13 +181,13 @@ def dict_transcode_tool_platform_get(operation_transcode = "encode"):
 		"flac": ("/usr/bin/flac", options_decode_flac)
 	}
 
-	if platform.system() == "Windows":
-		if operation_transcode == "encode":
+	if _IS_WINDOWS:
+		if operation_transcode is ModeTranscode.ENCODE:
 			dict_transcode_tool = dict_encode_tool_windows
 		else:
 			dict_transcode_tool = dict_decode_tool_windows
 	else:
-		if operation_transcode == "encode":
+		if operation_transcode is ModeTranscode.ENCODE:
 			dict_transcode_tool = dict_encode_tool_linux
 		else:
 			dict_transcode_tool = dict_decode_tool_linux
@@ -145,9 +195,18 @@ def dict_transcode_tool_platform_get(operation_transcode = "encode"):
 	return dict_transcode_tool, dict_valid_source, dict_valid_target
 
 
-# Return a tuple of main and relevant audio files
+# Extensions of the formats we transcode to, and hence "move" to the target
+EXTENSIONS_TRANSCODED = frozenset(dict_transcode_tool_platform_get()[1].keys())
+
+# Extensions of files relevant to the actual audio file (album art, playlists etc.), which
+# are "copied" to the target
+EXTENSIONS_RELEVANT_TO_AUDIO = frozenset(("mpc", "jpg", "jpeg", "png", "pls", "rtf", "txt", "accurip"))
+
+
+# Return a set of main and relevant audio files
+@functools.lru_cache(maxsize = None)
 def main_and_relevant_files_for_audio_get(extension_target):
-	return (extension_target, "mpc", "jpg", "jpeg", "png", "pls", "rtf", "txt", "accurip")
+	return EXTENSIONS_RELEVANT_TO_AUDIO | {extension_target}
 
 
 # Splits the path received into two parts:
@@ -165,9 +224,19 @@ def split_root_extension(source_path):
 	return root, extension
 
 
+# Return the extension of the file name (not path) passed, lower case converted, or an
+# empty string if it has none. As with os.path.splitext(), the leading dots of a name
+# don't start an extension. For filtering files by a set of extensions, this is cheaper
+# than split_root_extension(), and a regular expression, which backtracks over the name.
+def extension_of_name_get(name):
+	root, _, extension = name.rpartition(os.extsep)
+
+	return extension.lower() if root.lstrip(os.extsep) else ""
+
+
 # We support only Windows and Unix like OSes
 def is_supported_platform():
-	return platform.system() == "Windows" or platform.system() == "Linux"
+	return _IS_WINDOWS or _IS_LINUX
 
 
 # Open a file and log what we do
@@ -188,131 +257,320 @@ def logging_init():
 	else:
 		print("Check logging results at \'" + dirs.user_log_dir + "\'\n")
 
-		# All good. Proceed with logging.
-		logging.basicConfig(filename = dirs.user_log_dir + os.path.sep + name_script_executable + " - " +
-		                               time.strftime("%Y%m%d%I%M%S%z") + '.log', level = logging.INFO,
-		                    format = "%(message)s")
+		# All good. Proceed with logging. Records are merely queued by the calling thread, and
+		# written to the log file by a listener on a thread of its own, keeping file I/O off
+		# the processing loops. The listener buffers the records, and writes them to the file
+		# in batches, or right away on a critical error. Errors on a file (a failed transcode,
+		# a missing transcoder) can turn up for every file in a library, so they wait for the
+		# batch like any other record.
+		handler_file = logging.FileHandler(dirs.user_log_dir + os.path.sep + name_script_executable + " - " +
+		                                   time.strftime("%Y%m%d%I%M%S%z") + '.log')
+		handler_file.setFormatter(logging.Formatter("%(message)s"))
+		handler_buffer = logging.handlers.MemoryHandler(COUNT_RECORDS_PER_LOG_WRITE, flushLevel = logging.CRITICAL,
+		                                                target = handler_file)
+
+		queue_log = queue.SimpleQueue()
+		listener_log = logging.handlers.QueueListener(queue_log, handler_buffer)
+
+		logger = logging.getLogger()
+		logger.setLevel(logging.INFO)
+		logger.addHandler(logging.handlers.QueueHandler(queue_log))
+
+		listener_log.start()
+		# Drain the queue, and then the buffer, to the log file before the interpreter goes
+		# down. Functions registered last run first.
+		atexit.register(handler_buffer.flush)
+		atexit.register(listener_log.stop)
+
 		logging.info("Log beginning at " + time.strftime("%d %b %Y (%a) %I:%M:%S %p %Z (GMT%z)") + " with PID: " + str(
 			os.getpid()) + ", started with arguments " + str(sys.argv) + "\n")
 
 
+COUNT_RECORDS_PER_LOG_WRITE = 1024
+
+
 # Formats the size, based on the value
 def sizeof_fmt(num, suffix = 'B'):
-	for unit in ('', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi'):
-		if abs(num) < 1024.0:
-			return "%3.1f%s%s" % (num, unit, suffix)
-		num /= 1024.0
+	# Every unit is 2^10 times the one before, so the bit length of the (integral) size
+	# picks the unit without dividing it down one unit at a time
+	index_unit = min(max(abs(int(num)).bit_length() - 1, 0) // 10, len(UNITS_SIZE) - 1)
+
+	return "%3.1f%s%s" % (num / (1 << (index_unit * 10)), UNITS_SIZE[index_unit], suffix)
 
-	return "%.1f%s%s" % (num, 'Yi', suffix)
+
+UNITS_SIZE = ('', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi', 'Yi')
+
+
+# Print a message, and log it at the level passed. The message is built once for both
+# off the %-style format and its arguments. The bell, if asked for, is rung on the console
+# alone.
+def print_and_log(level, msg_format, *args, bell = False):
+	message = msg_format % args if args else msg_format
+
+	print("\a" + message if bell else message)
+
+	# The logger checks the level (cached) before as much as creating a record
+	_logger_root.log(level, message)
+
+
+# The root logger, which logging_init() sets up, bound once for print_and_log() to skip
+# the lookup the module level functions of logging do for every message
+_logger_root = logging.getLogger()
 
 
 # Print a spacer after every file's processing for sifting through the output
-# and log
+# and log. Since the standard output is block buffered (see main()), flush it
+# every few files for the user to follow the progress.
 def print_and_log_spacer(count, file, size_file, operation):
-	print("[File " + "{:>4}]".format(count) + "[{:>8}]".format(
-		size_file) + " \'" + file + "\' " + operation + " complete\n")
-	logging.info("[File " + "{:>4}]".format(count) + "[{:>8}]".format(
-		size_file) + " \'" + file + "\' " + operation + " complete\n")
+	print_and_log(logging.INFO, "[File %4d][%8s] \'%s\' %s complete\n", count, size_file, file, operation)
 
+	if not count % COUNT_FILES_PER_FLUSH_STDOUT:
+		sys.stdout.flush()
+
+
+COUNT_FILES_PER_FLUSH_STDOUT = 16
+
+
+# Errors the kernel refuses to copy a file in kernel space with. Older kernels do not
+# copy_file_range(2) across filesystems, and some filesystems not at all.
+ERRNOS_COPY_IN_KERNEL_REFUSED = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL)
+
+
+# Copy the file to the target directory, preserving its metadata. On Linux, the kernel copies
+# the data itself with copy_file_range(2), sparing the bounce through user space, and merely
+# shares the blocks on filesystems that support it (Btrfs, XFS). Where copy_file_range(2)
+# refuses, sendfile(2) still copies within the kernel. Should that refuse too, and on other
+# platforms (CopyFileW() on Windows is efficient as is), shutil.copy2() takes over.
+def copy_file(file_source, target_absolute_directory):
+	if _IS_LINUX and hasattr(os, "copy_file_range"):
+		path_target = os.path.join(target_absolute_directory, os.path.basename(file_source))
+
+		try:
+			with open(file_source, "rb") as file_read, open(path_target, "wb") as file_write:
+				fd_read = file_read.fileno()
+				fd_write = file_write.fileno()
+				size_left = os.fstat(fd_read).st_size
+				copy_file_range_usable = True
+
+				# Have the kernel read ahead aggressively; the source is read once, start to end
+				os.posix_fadvise(fd_read, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+				# The kernel may copy less than asked for; carry on till done. Both calls carry on
+				# from, and move on, the positions of the files.
+				while size_left > 0:
+					if copy_file_range_usable:
+						try:
+							size_copied = os.copy_file_range(fd_read, fd_write, size_left)
+						except OSError as error_copy:
+							if error_copy.errno not in ERRNOS_COPY_IN_KERNEL_REFUSED:
+								raise
+
+							copy_file_range_usable = False
+
+							continue
+					else:
+						size_copied = os.sendfile(fd_write, fd_read, None, size_left)
+
+					# Some filesystems (FUSE, NFS, overlays) copy nothing, short of the end, without
+					# an error. Take it for a refusal, rather than the source having shrunk.
+					if not size_copied:
+						break
+
+					size_left -= size_copied
+		except OSError as error_copy:
+			if error_copy.errno not in ERRNOS_COPY_IN_KERNEL_REFUSED:
+				raise
+		else:
+			# Copied in full; else, have shutil.copy2() copy it over afresh
+			if not size_left:
+				shutil.copystat(file_source, path_target)
+
+				return
+
+	shutil.copy2(file_source, target_absolute_directory, follow_symlinks = True)
+
+
+# Return renameat2(2) off the C library on Linux, or None where it's not to be had (glibc
+# older than 2.28, other platforms)
+@functools.lru_cache(maxsize = 1)
+def renameat2_get():
+	if not _IS_LINUX:
+		return None
+
+	try:
+		renameat2 = ctypes.CDLL(None, use_errno = True).renameat2
+	except (OSError, AttributeError):
+		return None
+
+	renameat2.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint)
+	renameat2.restype = ctypes.c_int
+
+	return renameat2
+
+
+# Arguments to renameat2(2) from <fcntl.h> and <linux/fs.h>: resolve relative paths
+# against the working directory, and fail rather than replace an existing target
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
 
-def move_or_copy_file(file_source, target_absolute_directory, extension_target):
-	_, dict_valid_source, _ = dict_transcode_tool_platform_get()
 
-	_, extension = split_root_extension(file_source)
+# Rename the file, raising FileExistsError rather than replacing an existing target. On
+# Linux, renameat2(2) checks for the target and renames in one step. Elsewhere, or if the
+# kernel or filesystem doesn't support the flag, check for the target before renaming.
+def rename_no_replace(path_source, path_target):
+	renameat2 = renameat2_get()
+
+	if renameat2:
+		if not renameat2(AT_FDCWD, os.fsencode(path_source), AT_FDCWD, os.fsencode(path_target), RENAME_NOREPLACE):
+			return
+
+		errno_rename = ctypes.get_errno()
+
+		if errno_rename not in (errno.EINVAL, errno.ENOSYS):
+			raise OSError(errno_rename, os.strerror(errno_rename), path_source, None, path_target)
+
+	if os.path.exists(path_target):
+		raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path_source, None, path_target)
+
+	os.rename(path_source, path_target)
+
+
+# Move the file to the target directory. On the same filesystem, this is merely a rename.
+# Across filesystems, the data is copied over by copy_file(), which keeps large files in
+# the kernel rather than reading them through a buffer, before the source is deleted.
+def move_file(file_source, target_absolute_directory):
+	path_target = os.path.join(target_absolute_directory, os.path.basename(file_source))
+
+	# Try renaming straight away, rather than finding out first if the source and target
+	# are on the same filesystem. The rename tells us otherwise.
+	try:
+		rename_no_replace(file_source, path_target)
+	except FileExistsError:
+		# Like shutil.move(), do not overwrite an existing file in the target
+		raise shutil.Error("Destination path \'" + path_target + "\' already exists") from None
+	except OSError as error_rename:
+		# Across filesystems (and bind mounts of the same one), copy instead
+		if error_rename.errno != errno.EXDEV:
+			raise
+	else:
+		return
+
+	# Like shutil.move(), do not overwrite an existing file in the target
+	if os.path.exists(path_target):
+		raise shutil.Error("Destination path \'" + path_target + "\' already exists")
+
+	copy_file(file_source, target_absolute_directory)
+
+	# Delete the source only once the target is known to hold all of it. Should the copy
+	# have come up short, drop the target instead, and keep the source.
+	if os.stat(path_target).st_size != os.stat(file_source).st_size:
+		with suppress(FileNotFoundError):
+			os.unlink(path_target)
+
+		raise shutil.Error("Copying to \'" + path_target + "\' came up short; source left in place")
+
+	os.unlink(file_source)
+
+
+# Move or copy the file to the target directory. The caller may pass the size of the file
+# if it's already known, say from listing the source directory, to save a syscall.
+def move_or_copy_file(file_source, target_absolute_directory, stats, size_file = None):
+	extension = extension_of_name_get(os.path.basename(file_source))
+
+	if size_file is None:
+		size_file = os.path.getsize(file_source)
 
-	size_file = os.path.getsize(file_source)
 	size_file_formatted = sizeof_fmt(size_file)
 
 	# If it's a transcoded audio file, "move" it to the target.
 	# Add to the dictionary keys if other formats are required.
-	if extension in tuple(dict_valid_source.keys()):
-		print("Moving \'" + file_source + "\' (" + size_file_formatted + ")\n-> \'" + target_absolute_directory + "\'")
-		logging.info(
-			"Moving \'" + file_source + "\' (" + size_file_formatted + ")\n-> \'" + target_absolute_directory + "\'")
+	if extension in EXTENSIONS_TRANSCODED:
+		print_and_log(logging.INFO, "Moving \'%s\' (%s)\n-> \'%s\'", file_source, size_file_formatted,
+		              target_absolute_directory)
 
 		try:
-			shutil.move(file_source, target_absolute_directory)
+			move_file(file_source, target_absolute_directory)
 		except (OSError, IOError, shutil.Error) as error_move:
-			print("Error moving file \'" + file_source + "\'\n-> \'" + target_absolute_directory + "\'")
-			print(error_move.stderr)
-
-			logging.error(
-				"Error moving file \'" + file_source + "\'\n-> \'" + target_absolute_directory + "\' ")
-			logging.error(error_move.stderr)
+			print_and_log(logging.ERROR, "Error moving file \'%s\'\n-> \'%s\'", file_source, target_absolute_directory)
+			print_and_log(logging.ERROR, "%s", error_move)
 		else:
 			# Specifically, keep count of the number of files moved
-			move_or_copy_file.total_count_moved += 1
-			# Keep count of the number of files processed
-			move_or_copy_file.total_count += 1
+			stats.count_moved += 1
 			# Add up the statistic to later display how much data was moved
-			move_or_copy_file.total_size += size_file
+			stats.size_relocated += size_file
 
-			print_and_log_spacer(move_or_copy_file.total_count, file_source, size_file_formatted, "move")
+			print_and_log_spacer(stats.count_moved + stats.count_copied, file_source, size_file_formatted, "move")
 	# For album art and other non-transcoded audio (with exceptions like .mpc files,
 	# "copy" to the target so we don't disturb the source's integrity
-	elif extension in (main_and_relevant_files_for_audio_get(extension_target)[1:]):
-		print("Copying \'" + file_source + "\' (" + size_file_formatted + ")\n-> \'" + target_absolute_directory + "\'")
-		logging.info(
-			"Copying \'" + file_source + "\' (" + size_file_formatted + ")\n-> \'" + target_absolute_directory + "\'")
+	elif extension in EXTENSIONS_RELEVANT_TO_AUDIO:
+		print_and_log(logging.INFO, "Copying \'%s\' (%s)\n-> \'%s\'", file_source, size_file_formatted,
+		              target_absolute_directory)
 
 		try:
-			shutil.copy2(file_source, target_absolute_directory, follow_symlinks = True)
+			copy_file(file_source, target_absolute_directory)
 		except (OSError, IOError, shutil.Error) as error_copy:
-			print("Error copying file \'" + file_source + "\' to \'" + target_absolute_directory + "\'")
-			print(error_copy.stderr)
-
-			logging.error(
-				"Error copying file \'" + file_source + "\' to \'" + target_absolute_directory + "\' ")
-			logging.error(error_copy.stderr)
+			print_and_log(logging.ERROR, "Error copying file \'%s\' to \'%s\'", file_source, target_absolute_directory)
+			print_and_log(logging.ERROR, "%s", error_copy)
 		else:
 			# Add up the statistic to later display how much data was moved
-			move_or_copy_file.total_size += size_file
-			# Keep count of the number of files processed
-			move_or_copy_file.total_count += 1
-			print_and_log_spacer(move_or_copy_file.total_count, file_source, size_file_formatted, "copy")
+			stats.size_relocated += size_file
+			# Keep count of the number of files copied
+			stats.count_copied += 1
+			print_and_log_spacer(stats.count_moved + stats.count_copied, file_source, size_file_formatted, "copy")
+
+
+# Directories created, or found to exist so far. Relocation asks for the directory of
+# every file it handles, so remember them to save a syscall or two per file. Only
+# directories known to exist are remembered, as a missing one may be created after.
+_set_directories_existing = set()
+
+
+# Check if the directory exists, asking the filesystem only if it isn't known to
+def directory_exists(directory):
+	if directory in _set_directories_existing:
+		return True
 
+	if os.path.isdir(directory):
+		_set_directories_existing.add(directory)
 
-move_or_copy_file.total_count = 0
-move_or_copy_file.total_count_moved = 0
-move_or_copy_file.total_size = 0
+		return True
+
+	return False
 
 
 def create_directory(target_absolute_directory):
 	# Default directory creation result to success
 	status = True
 
-	# Attempt to create only if the target doesn't already exist
-	if not os.path.exists(target_absolute_directory):
+	# Attempt to create only if we haven't already done so. There's no need to check if
+	# the target exists beforehand; mkdir() tells us.
+	if target_absolute_directory not in _set_directories_existing:
 		try:
-			pathlib.Path(target_absolute_directory).mkdir(parents = True, exist_ok = True)
+			os.makedirs(target_absolute_directory)
+		except FileExistsError:
+			_set_directories_existing.add(target_absolute_directory)
 		except (OSError, IOError, shutil.Error) as error_mkdir:
 			# Screwed! Should mostly be a permission issue. Flag, and report error.
 			status = False
 
-			print("Error creating target directory path \'" + target_absolute_directory + "\'\n")
-			print(error_mkdir.output)
-			print(error_mkdir.stderr)
-
-			logging.error(
-				"Error creating target directory path \'" + target_absolute_directory + "\'\n")
-			logging.error(error_mkdir.output)
-			logging.error(error_mkdir.stderr)
+			print_and_log(logging.ERROR, "Error creating target directory path \'%s\'\n", target_absolute_directory)
+			print_and_log(logging.ERROR, "%s", error_mkdir)
 		else:
-			print("\nCreated directory \'" + target_absolute_directory + "\'\n")
-			logging.info("\nCreated directory \'" + target_absolute_directory + "\'\n")
+			_set_directories_existing.add(target_absolute_directory)
 
-	return status
+			print_and_log(logging.INFO, "\nCreated directory \'%s\'\n", target_absolute_directory)
 
+	return status
 
-def build_target_and_operate(root_source, dir_source, file_source, dir_destination, extension_target):
-	root, extension_source = split_root_extension(file_source)
 
+def build_target_and_operate(root_source, dir_source, file_source, dir_destination, extension_target, stats,
+                             size_file = None):
 	# Only process audio (actual audio, playlist, cue etc.) and image (album art) files.
 	#
 	# Note: We are only "moving" transcoded *audio* files (specified in the filter
 	# list below), and will be "copying" any other relevant, but *non-audio* files
 	# to not disturb the integrity of the source directory.
-	if extension_source in main_and_relevant_files_for_audio_get(extension_target):
+	if extension_of_name_get(file_source) in main_and_relevant_files_for_audio_get(extension_target):
 		# Stamp the start time in nanoseconds
 		time_start = time.monotonic_ns()
 
@@ -320,8 +578,8 @@ def build_target_and_operate(root_source, dir_source, file_source, dir_destinati
 		# contain the file's name without path. dir_source would contain the
 		# path (relative, or absolute, based on what was passed on the command
 		# line) of the file in question. Else, if we came here on getting a
-		# straight file on the command line, dir_source would be an empty string,
-		# still leading to a valid value in the statement below.
+		# straight file on the command line, root_source would be an empty string,
+		# and dir_source the directory of the file.
 		path_file_source = os.path.join(dir_source, file_source)
 
 		# We're dealing with walking through files in a directory passed by the caller
@@ -335,24 +593,49 @@ def build_target_and_operate(root_source, dir_source, file_source, dir_destinati
 			create_directory(target_absolute_directory)
 
 			# By now the target directory should be in place
-			move_or_copy_file(path_file_source, target_absolute_directory, extension_target)
+			move_or_copy_file(path_file_source, target_absolute_directory, stats, size_file)
 		else:
 			# We're dealing *only* with a single file passed by the caller
-			move_or_copy_file(os.path.join(dir_source, file_source), dir_destination, extension_target)
+			move_or_copy_file(os.path.join(dir_source, file_source), dir_destination, stats, size_file)
 
 		# Stamp the end time in nanoseconds
 		time_end = time.monotonic_ns()
 
 		# Aggregate the numbers to provide a statistic at exit
-		build_target_and_operate.total_time_ns_relocate += time_end - time_start
+		stats.time_ns_relocate += time_end - time_start
 
 
-build_target_and_operate.total_time_ns_relocate = 0
+# Check if the transcode tool exists. The tools are not expected to come or go while we
+# run, so the check is done once per tool, however often the source formats switch.
+@functools.lru_cache(maxsize = None)
+def transcode_tool_exists(transcode_tool):
+	return os.path.isfile(transcode_tool)
 
 
-# Transcode the source audio file to the intended target format
-def transcode_source_audio(path_source_audio_file, format_target, operation_transcode, percentage_gather = False,
-                           dict_files_failed = False):
+# Claim the target file passed by creating it, only if it does not already exist. Checking
+# for the file and creating it is one atomic step, so no two transcodes can end up writing
+# the same target. Returns False if the file already exists; any other error creating it
+# (say, a read-only source, or a name too long for the filesystem) is raised.
+def transcode_target_claim(path_target_audio_file):
+	try:
+		os.close(os.open(path_target_audio_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+	except FileExistsError:
+		return False
+
+	return True
+
+
+# Give up the claim on the target file passed, along with whatever a transcoder left of it,
+# so that the next run doesn't skip its source as transcoded
+def transcode_target_release(path_target_audio_file):
+	with suppress(FileNotFoundError):
+		os.unlink(path_target_audio_file)
+
+
+# Resolve the target file, and the command line transcoding the source audio file to the
+# intended target format. The command is None if the source is not to be transcoded. The
+# target file is claimed only as the command is run, by transcode_source_audio_worker().
+def transcode_command_get(path_source_audio_file, format_target, operation_transcode):
 	root, extension_original = split_root_extension(path_source_audio_file)
 
 	# Save a reference for the (yet to be built) target file's extension to reflect
@@ -365,143 +648,199 @@ def transcode_source_audio(path_source_audio_file, format_target, operation_tran
 	# As an optimization for transcoding more than one file, if the current target
 	# format is the same as the previous one, re-use validation that was already
 	# done to save dictionary lookups and path checks
-	if extension_original == transcode_source_audio.extension_prev:
-		target = transcode_source_audio.target_prev
-		is_valid_source = transcode_source_audio.is_valid_source_prev
-		does_transcode_tool_exist = transcode_source_audio.does_transcode_tool_exist_prev
-		transcode_tool = transcode_source_audio.transcode_tool_prev
-		options = transcode_source_audio.options_prev
+	if extension_original == transcode_command_get.extension_prev:
+		target = transcode_command_get.target_prev
+		is_valid_source = transcode_command_get.is_valid_source_prev
+		does_transcode_tool_exist = transcode_command_get.does_transcode_tool_exist_prev
+		transcode_tool = transcode_command_get.transcode_tool_prev
+		options = transcode_command_get.options_prev
 	else:
 		# Save the current parameters for the next run. If we encounter the same target
 		# in the next run, it saves dictionary lookups and checks.
 		dict_transcode_tool, dict_valid_source, dict_valid_target = dict_transcode_tool_platform_get(
 			operation_transcode)
-		transcode_source_audio.extension_prev = extension_original
-		transcode_source_audio.dict_transcode_tool_prev = dict_transcode_tool
-		transcode_source_audio.dict_valid_source_prev = dict_valid_source
-		transcode_source_audio.dict_valid_target_prev = dict_valid_target
-		transcode_source_audio.target_prev = target = dict_valid_target[extension]
-		transcode_source_audio.is_valid_source_prev = is_valid_source = extension_original.lower() in dict_valid_source[
+		transcode_command_get.extension_prev = extension_original
+		transcode_command_get.dict_transcode_tool_prev = dict_transcode_tool
+		transcode_command_get.dict_valid_source_prev = dict_valid_source
+		transcode_command_get.dict_valid_target_prev = dict_valid_target
+		transcode_command_get.target_prev = target = dict_valid_target[extension]
+		transcode_command_get.is_valid_source_prev = is_valid_source = extension_original.lower() in dict_valid_source[
 			extension]
-		transcode_source_audio.does_transcode_tool_exist_prev = does_transcode_tool_exist = os.path.isfile(
+		transcode_command_get.does_transcode_tool_exist_prev = does_transcode_tool_exist = transcode_tool_exists(
 			dict_transcode_tool[extension][INDEX_DICT_TRANSCODE_TOOL])
-		transcode_source_audio.transcode_tool_prev = transcode_tool = dict_transcode_tool[extension][
+		transcode_command_get.transcode_tool_prev = transcode_tool = dict_transcode_tool[extension][
 			INDEX_DICT_TRANSCODE_TOOL]
-		transcode_source_audio.options_prev = options = (dict_transcode_tool[extension][1:])[0]
+		transcode_command_get.options_prev = options = (dict_transcode_tool[extension][1:])[0]
 
 	# Save a reference for the (yet to be transcoded) target file
 	path_target_audio_file = root + os.extsep + target
+	command = None
 
 	# If ffmpeg is set as the Opus encoding tool, disable the check below as it
 	# supports every possible format in the world!
 
 	# Check if the source file format is valid for the transcoder
 	if is_valid_source:
+		# Check if the transcoding tool exists in the path defined
+		if not does_transcode_tool_exist:
+			print_and_log(logging.ERROR, "No such transcode tool as \'%s\'. Is its path correct?", transcode_tool)
 		# Proceed to transcode only if the target file does not already exist
-		if not os.path.exists(path_target_audio_file):
-			if percentage_gather:
-				transcode_source_audio.total_count_source += 1
+		elif not os.path.exists(path_target_audio_file):
+			# Note: dict_transcode_tool[format_target][0] refers to the transcode tool path (absolute/relative)
+			#       dict_transcode_tool[format_target][1] refers to the transcode tool's options
+			#
+			# WARNING: The order of arguments to the command line below are very important. Do not change
+			# unless you know what you're tinkering with, or it will break the execution, and the obvious batch
+			# processing which this function was invoked from.
+
+			# Build the command line in one go, unpacking the options in between
+			command = [transcode_tool, path_source_audio_file, *options, path_target_audio_file]
+		else:
+			print_and_log(logging.WARNING, "Skipping \'%s\' as transcoded file \'%s\' already exists",
+			              path_source_audio_file, path_target_audio_file)
+
+	return path_target_audio_file, command
+
+
+transcode_command_get.dict_transcode_tool_prev = None
+transcode_command_get.dict_valid_source_prev = None
+transcode_command_get.dict_valid_target_prev = None
+transcode_command_get.extension_prev = None
+transcode_command_get.is_valid_source_prev = None
+transcode_command_get.does_transcode_tool_exist_prev = None
+transcode_command_get.options_prev = None
+transcode_command_get.transcode_tool_prev = None
+transcode_command_get.target_prev = None
+
+
+# Run the transcoder for a job built off transcode_command_get(). Since this may run on a
+# worker thread, nothing is accounted for here; instead, a tuple of the success of the
+# transcode, the time it took in nanoseconds and the reason for a failure is returned for
+# the caller to aggregate.
+def transcode_source_audio_worker(job):
+	path_source_audio_file, path_target_audio_file, command = job
+	_, target = split_root_extension(path_target_audio_file)
+
+	# Claim the target only now that the transcoder is about to write it, so that a job lined
+	# up but never run leaves no claim behind. The target was checked for when the job was
+	# lined up, so it turning up since means another transcode (say, another run) got to it.
+	try:
+		is_target_claimed = transcode_target_claim(path_target_audio_file)
+	except OSError as error_claim:
+		# Fail just this file, rather than have the error abort every other transcode in the pool
+		print_and_log(logging.ERROR, "Error creating transcoded file \'%s\'", path_target_audio_file, bell = True)
+		print_and_log(logging.ERROR, "%s", error_claim)
 
-				# We're here only to get the total count of files to be transcoded, to report
-				# the percentage of completion after every file. So return without any actual
-				# processing.
-				return
+		return False, 0, "\nThe transcoded file could not be created next to the source. Check that the source " \
+		                 "directory is writable, and that the file name is not too long for the filesystem."
 
-			# Check if the transcoding tool exists in the path defined
-			if does_transcode_tool_exist:
-				print("\nTranscoding \'" + path_source_audio_file + "\' to \'" + target.capitalize() + "\' format...\n")
-				logging.info(
-					"\nTranscoding \'" + path_source_audio_file + "\' to \'" + target.capitalize() + "\' format...\n")
-				output_transcode = ""
-				# Note: dict_transcode_tool[format_target][0] refers to the transcode tool path (absolute/relative)
-				#       dict_transcode_tool[format_target][1] refers to the transcode tool's options
-				#
-				# WARNING: The order of arguments to the command line below are very important. Do not change
-				# unless you know what you're tinkering with, or it will break the execution, and the obvious batch
-				# processing which this function was invoked from.
-
-				# Track transcoding start time in nano-seconds
-				time_ns_start = time.monotonic_ns()
+	if not is_target_claimed:
+		print_and_log(logging.WARNING, "Skipping \'%s\' as transcoded file \'%s\' turned up meanwhile",
+		              path_source_audio_file, path_target_audio_file)
 
-				try:
-					# Make a whole tuple out of individual tuples and strings by concatenating
-					output_transcode = subprocess.run(
-						(transcode_tool, path_source_audio_file) + options + tuple([path_target_audio_file]),
-						stdout = subprocess.PIPE, check = True, universal_newlines = True).stdout
-				except subprocess.CalledProcessError as error_transcode:
-					print(error_transcode.stderr)
-					print(error_transcode.output)
-
-					logging.error(error_transcode.stderr)
-					logging.error(error_transcode.output)
-
-					print("\aError transcoding \'" + path_source_audio_file + "\'")
-					print("\aError", sys.exc_info())
-					logging.error("Error transcoding \'" + path_source_audio_file + "\'" + str(sys.exc_info()))
-
-					print("\nCommand that resulted in the exception: " + str(error_transcode.cmd) + "\n")
-					logging.info("\nCommand that resulted in the exception: " + str(error_transcode.cmd) + "\n")
-
-					# Append the failed transcoding to a dict with the reason. This will be used in printing
-					# a statistic at exit.
-					dict_files_failed[path_source_audio_file] = "\nIf the source is in wav format, transcode to " \
-					                                            "flac. Else, if the source is in flac, transcode " \
-					                                            "to wav, and then back to flac. This is most " \
-					                                            "likely an error due to an incompatible PCM " \
-					                                            "format, or due to the OS character set encoding."
-
-					show_toast("Error", "Failed to convert one or more files. Check the log.")
-				else:
-					# Track transcoding end time in nano-seconds
-					time_ns_end = time.monotonic_ns()
+		return False, 0, "\nThe transcoded file turned up after the source was lined up for transcoding, " \
+		                 "most likely from another run transcoding the same file. It is left as is."
 
-					# Keep track of the number of files transcoded to present a total statistic at exit
-					transcode_source_audio.total_count_transcode += 1
+	print_and_log(logging.INFO, "\nTranscoding \'%s\' to \'%s\' format...\n", path_source_audio_file,
+	              target.capitalize())
 
-					# Save the total time taken to transcode files thrown at us, to report a statistic at exit
-					transcode_source_audio.total_time_ns_transcode += time_ns_end - time_ns_start
-			else:
-				print("No such transcode tool as \'" + transcode_tool + "\'. Is its path correct?")
-				logging.error("No such transcode tool as \'" + transcode_tool + "\'. Is its path correct?")
-		else:
-			# No need to report if we're only gathering headcount. Hence, bolt out.
-			if percentage_gather:
-				return
+	# Track transcoding start time in nano-seconds
+	time_ns_start = time.monotonic_ns()
+
+	try:
+		# Nothing on the transcoder's output is of use to us, so discard it. Its diagnostics
+		# are captured for reporting a failure, which also keeps the progress of transcoders
+		# running in parallel from garbling the console.
+		subprocess.run(command, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, check = True)
+	except subprocess.CalledProcessError as error_transcode:
+		# Decode only now that we need to show it
+		stderr_transcode = error_transcode.stderr.decode(errors = "replace")
+
+		print_and_log(logging.ERROR, stderr_transcode)
+
+		print_and_log(logging.ERROR, "Error transcoding \'%s\'", path_source_audio_file, bell = True)
+		print_and_log(logging.ERROR, "%s", error_transcode)
+
+		print_and_log(logging.INFO, "\nCommand that resulted in the exception: %s\n", error_transcode.cmd)
+
+		transcode_target_release(path_target_audio_file)
+
+		return False, 0, "\nIf the source is in wav format, transcode to flac. Else, if the source is in flac, " \
+		                 "transcode to wav, and then back to flac. This is most likely an error due to an " \
+		                 "incompatible PCM format, or due to the OS character set encoding."
+	except BaseException:
+		# Be it the transcoder failing to run at all, or the user interrupting the run, the
+		# target is not to be left behind as a transcoded file
+		transcode_target_release(path_target_audio_file)
 
-			print(
-				"Skipping \'" + path_source_audio_file + "\' as transcoded file \'" + path_target_audio_file + "\' already exists")
-			logging.error(
-				"Skipping \'" + path_source_audio_file + "\' as transcoded file \'" + path_target_audio_file + "\' already exists")
-
-		# transcode_source_audio.total_count_source would not be greater than zero if a single file is being
-		# dealt with, or percentage completion is not to be reported
-		if transcode_source_audio.total_count_source and transcode_source_audio.total_count_transcode:
-			percent_complete = str(
-				math.floor(
-					(transcode_source_audio.total_count_transcode / transcode_source_audio.total_count_source) * 100))
-
-			if transcode_source_audio.total_count_transcode < transcode_source_audio.total_count_source:
-				print("\n" + percent_complete + "% of files in queue transcoded\n")
-				logging.info("\n" + percent_complete + "% of files in queue transcoded\n")
+		raise
+
+	# Track transcoding end time in nano-seconds
+	time_ns_end = time.monotonic_ns()
+
+	return True, time_ns_end - time_ns_start, None
+
+
+# Account for the result of a transcode job submitted to a pool, and forget the job. The
+# transcoded file is returned if the transcode was successful.
+def transcode_future_aggregate(future, dict_future_job, dict_files_failed, stats):
+	path_source_audio_file, path_target_audio_file = dict_future_job.pop(future)
+	result = future.result()
+
+	transcode_result_aggregate(path_source_audio_file, result, dict_files_failed, stats)
+
+	return path_target_audio_file if result[0] else None
+
+
+# Account for the result of a transcode returned by transcode_source_audio_worker()
+def transcode_result_aggregate(path_source_audio_file, result, dict_files_failed, stats):
+	success, time_ns_transcode, reason_failure = result
+
+	if success:
+		# Keep track of the number of files transcoded to present a total statistic at exit
+		stats.count_transcoded += 1
+
+		# Save the total time taken to transcode files thrown at us, to report a statistic at exit
+		stats.time_ns_transcode += time_ns_transcode
+	else:
+		# Append the failed transcoding to a dict with the reason. This will be used in printing
+		# a statistic at exit.
+		dict_files_failed[path_source_audio_file] = reason_failure
+
+		show_toast("Error", "Failed to convert one or more files. Check the log.")
+
+	count_transcoded = stats.count_transcoded
+	count_transcode_queued = stats.count_transcode_queued
+
+	# count_transcode_queued would not be greater than zero if a single file is being
+	# dealt with, or percentage completion is not to be reported
+	if count_transcode_queued and count_transcoded:
+		# Integer math floors the percentage by itself
+		percent_complete = (count_transcoded * 100) // count_transcode_queued
+
+		# Report only when the percentage moves, and not after every file
+		if percent_complete != stats.percent_complete_reported:
+			stats.percent_complete_reported = percent_complete
+
+			if count_transcoded < count_transcode_queued:
+				print_and_log(logging.INFO, "\n%d%% of files in queue transcoded\n", percent_complete)
 			else:
-				print("All files in queue transcoded\n")
-				logging.info("All files in queue transcoded\n")
+				print_and_log(logging.INFO, "All files in queue transcoded\n")
 
-	return path_target_audio_file
+	# Transcodes take a while each, so it's cheap to let the user know of the progress after every one
+	sys.stdout.flush()
 
 
-transcode_source_audio.total_time_ns_transcode = 0
-transcode_source_audio.total_count_transcode = 0
-transcode_source_audio.total_count_source = 0
-transcode_source_audio.dict_transcode_tool_prev = None
-transcode_source_audio.dict_valid_source_prev = None
-transcode_source_audio.dict_valid_target_prev = None
-transcode_source_audio.extension_prev = None
-transcode_source_audio.is_valid_source_prev = None
-transcode_source_audio.does_transcode_tool_exist_prev = None
-transcode_source_audio.options_prev = None
-transcode_source_audio.transcode_tool_prev = None
-transcode_source_audio.target_prev = None
+# Transcode the source audio file to the intended target format
+def transcode_source_audio(path_source_audio_file, format_target, operation_transcode, dict_files_failed, stats):
+	path_target_audio_file, command = transcode_command_get(path_source_audio_file, format_target,
+	                                                        operation_transcode)
+
+	if command:
+		transcode_result_aggregate(path_source_audio_file, transcode_source_audio_worker(
+			(path_source_audio_file, path_target_audio_file, command)), dict_files_failed, stats)
+
+	return path_target_audio_file
 
 
 # Convert the time in nanoseconds passed to hours, minutes and seconds as a string
@@ -532,13 +871,50 @@ def total_time_in_hms_get(total_time_ns):
 		seconds) + " seconds")
 
 
+# Walk the directory tree passed, yielding the os.DirEntry of every file having one of the
+# extensions passed, along with its extension (lower case converted). Unlike os.walk(),
+# os.scandir() hands out the entries as the directory is read, with the file type (and on
+# Windows, the size) cached in them. Directories are walked off a stack rather than by
+# recursing, so only one directory is held open at a time, and no entry is passed up a
+# chain of generators as deep as the tree.
+def iter_audio_files(root, extensions):
+	stack_dirs = [root]
+
+	while stack_dirs:
+		# Skip directories we can't list, as os.walk() would
+		try:
+			entries = os.scandir(stack_dirs.pop())
+		except OSError:
+			continue
+
+		with entries:
+			for entry in entries:
+				if entry.is_dir(follow_symlinks = False):
+					stack_dirs.append(entry.path)
+				elif entry.is_file():
+					extension = extension_of_name_get(entry.name)
+
+					if extension in extensions:
+						yield entry, extension
+
+
+# Feed the queue passed with the files found by iter_audio_files(), and mark the end of
+# the listing with None. Runs on a thread of its own, so the directory tree is listed
+# while the files already found are being transcoded.
+def iter_audio_files_enqueue(root, extensions, queue_files):
+	try:
+		for entry_and_extension in iter_audio_files(root, extensions):
+			queue_files.put(entry_and_extension)
+	finally:
+		queue_files.put(None)
+
+
 # Delete all empty directories in the target path, that were created to
 # match the source structure
 def delete_empty_directories_in_target(dir_destination):
-	print(
-		"Cleaning up \'" + dir_destination + "\' by recursively deleting empty directories created to match the source path...")
-	logging.info(
-		"Cleaning up \'" + dir_destination + "\' by recursively deleting empty directories created to match the source path...")
+	print_and_log(logging.INFO,
+	              "Cleaning up \'%s\' by recursively deleting empty directories created to match the source path...",
+	              dir_destination)
 
 	for dir_name, _, _ in os.walk(dir_destination):
 		# Ignore directory not empty errors; nothing can be done about it if we want
@@ -547,12 +923,14 @@ def delete_empty_directories_in_target(dir_destination):
 		with suppress(OSError):
 			os.removedirs(dir_name)
 
-	print("\nDone cleaning up \'" + dir_destination + "\'\n")
-	logging.info("\nDone cleaning up \'" + dir_destination + "\'\n")
+	# Directories known to exist may have just been deleted
+	_set_directories_existing.clear()
+
+	print_and_log(logging.INFO, "\nDone cleaning up \'%s\'\n", dir_destination)
 
 
 # Parse command line arguments and return option and/or values of action
-def cmd_line_parse(opt_encode, opt_decode, opt_move_format, opt_percentage):
+def cmd_line_parse(opt_encode, opt_decode, opt_move_format, opt_percentage, opt_jobs):
 	# Not required to pass the parameter to dict_transcode_tool_platform_get(), as we're
 	# merely retrieving the list of keys for validating the formats to transcode
 	_, dict_valid_source, _ = dict_transcode_tool_platform_get()
@@ -576,6 +954,9 @@ def cmd_line_parse(opt_encode, opt_decode, opt_move_format, opt_percentage):
 	parser.add_argument("-p", opt_percentage, required = False, action = "store_true",
 	                    default = None, dest = "percentage",
 	                    help = "Show the percentage of files completed (not the actual data processed; just the files")
+	parser.add_argument("-j", opt_jobs, required = False, action = "store", type = int,
+	                    default = os.cpu_count() or 1, dest = "jobs",
+	                    help = "Specify the number of files to transcode in parallel. Defaults to the number of CPUs.")
 
 	# The user should either be encoding or decoding, not both to avoid ugly scenarios. Hence use a
 	# mutually exclusive group of options to handle the case.
@@ -597,90 +978,195 @@ def cmd_line_parse(opt_encode, opt_decode, opt_move_format, opt_percentage):
 
 	root_source = result_parse.source
 	dir_destination = result_parse.target
-	encode_to = result_parse.encode_to
-	decode_from = result_parse.decode_from
-	move_format = result_parse.move_format
 	percentage = result_parse.percentage
+	jobs = result_parse.jobs
+
+	# Resolve which one of the mutually exclusive options was passed in to the transcode mode,
+	# and the format it was passed with. The format is None if none of them was passed.
+	if result_parse.encode_to:
+		transcode, target = ModeTranscode.ENCODE, result_parse.encode_to
+	elif result_parse.decode_from:
+		transcode, target = ModeTranscode.DECODE, result_parse.decode_from
+	else:
+		transcode, target = ModeTranscode.NONE, result_parse.move_format
 
-	return root_source, dir_destination, encode_to, decode_from, move_format, percentage
+	return root_source, dir_destination, transcode, target, percentage, jobs
 
 
-def process_dir(root_source, dir_destination, dir_destination_original, target, transcode, percentage_gather = False,
-                dict_files_failed = False):
+def process_dir(root_source, dir_destination, dir_destination_original, target, transcode, stats, jobs,
+                percentage_show = False, dict_files_failed = False):
 	exit_code = 0
 
+	# Nothing to relocate if the source and destination directories are the same
+	relocate = root_source != dir_destination
+
 	# Set up the same target hierarchy as the source
-	if root_source != dir_destination:
+	if relocate:
 		# Let's set up a head directory path right under the destination,
 		# to reflect the source's relative hierarchical tree
 		dir_destination = os.path.join(os.sep, dir_destination + os.sep, os.path.basename(root_source))
 
-	# Create, if the destination directory doesn't already exist.
-	if os.path.exists(dir_destination) or create_directory(dir_destination):
+	# Create, if the destination directory doesn't already exist. create_directory() doesn't
+	# check beforehand, but has mkdir() tell it.
+	if create_directory(dir_destination):
 		# Target head directory now exists; proceed
 
-		# Be verbal only if we're about to transcode
-		if transcode and (not percentage_gather):
-			print("\nCommencing transcoding by recursing into source path \'" + root_source + "\'...\n")
-			logging.info("\nCommencing transcoding by recursing into source path \'" + root_source + "\'...\n")
-
-		# Transcode loop to handle converting applicable source files
-
 		# If we were asked to transcode before relocation, oblige
 		if transcode:
-			# Since we tripped on a directory, walk through for files below
-			for source_dir, _, file_names in os.walk(root_source):
-				for source_file in file_names:
-					# Note: While walking the tree, source_file would only
-					# contain the file's name without path. source_dir would
-					# contain the path (relative, or absolute, based on what
-					# was passed on the command line) of the file in question.
-					transcode_source_audio(os.path.join(source_dir, source_file), target, transcode, percentage_gather,
-					                       dict_files_failed)
-
-		# Our purpose is only to fetch a total count of files to be transcoded; scoot once done
-		if percentage_gather:
-			return
-
-		# Nothing to do if the source and destination directories are the same
-		if root_source != dir_destination:
-			print("\nRelocating transcoded files to the destination \'" + dir_destination + "\'...\n")
-			logging.info("\nRelocating transcoded files to the destination \'" + dir_destination + "\'...\n")
-
-			# Relocation loop for moving the actual transcoded files
-
-			# Since we tripped on a directory, walk through for files below
-			for source_dir, _, file_names in os.walk(root_source):
-				for source_file in file_names:
-					# Note: While walking the tree, source_file would only
-					# contain the file's name without path. source_dir would
-					# contain the path (relative, or absolute, based on what
-					# was passed on the command line) of the file in question.
-					build_target_and_operate(root_source, source_dir, source_file, dir_destination, target)
+			print_and_log(logging.INFO, "\nCommencing transcoding by recursing into source path \'%s\'...\n", root_source)
 
+			_, dict_valid_source, _ = dict_transcode_tool_platform_get(transcode)
+			extensions_transcode = frozenset(dict_valid_source[target])
+		else:
+			extensions_transcode = frozenset()
+
+		extensions_relocate = main_and_relevant_files_for_audio_get(target) if relocate else frozenset()
+
+		if extensions_transcode or extensions_relocate:
+			# A single listing of the source tree serves both the transcoding and the relocation.
+			# Bound the queue, so the listing doesn't run too far ahead of the transcoding.
+			queue_source = queue.Queue(maxsize = 256)
+			thread_list = threading.Thread(target = iter_audio_files_enqueue,
+			                               args = (root_source, extensions_transcode | extensions_relocate,
+			                                       queue_source),
+			                               daemon = True)
+			thread_list.start()
+
+			dict_future_job = {}
+			# Targets lined up for transcoding. Such a file could turn up in the listing as it is
+			# being written, but is to be relocated only once it is transcoded.
+			set_paths_transcoding = set()
+			count_jobs = 0
+			# Line up only enough jobs for the pool to always have the next one at hand. Rather than
+			# holding a future for every file in the library, this holds back the listing (through
+			# the bounded queue) till the transcoding catches up. Reporting the percentage needs
+			# the total count early though, so let the listing run its course in that case.
+			count_jobs_pending_max = None if percentage_show else jobs * 2
+
+			# Files (their name and size, if known) to be relocated, grouped by their directory, so
+			# that files landing in the same target directory are relocated back to back. Nothing is
+			# relocated till the listing is done. Else, a transcoded file found in the source could
+			# be moved before its source file is checked for having been transcoded already.
+			dict_dir_files_relocate = {}
+			# Source files that are to be relocated themselves (say, Opus files decoded to Wav) are
+			# held back till every transcode is done, so they aren't moved from under a transcoder
+			dict_dir_files_relocate_after_transcode = {}
+
+			# The transcoders are external processes, and each transcode is independent of the other.
+			# So threads merely waiting on them suffice to keep every CPU busy.
+			with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as executor:
+				try:
+					for entry, extension in iter(queue_source.get, None):
+						command = None
+
+						if extension in extensions_transcode:
+							path_target_audio_file, command = transcode_command_get(entry.path, target, transcode)
+
+							# Another source (say, a Wav and an Aiff of the same song) could already be lined
+							# up for the same target, which it hasn't created yet
+							if command and path_target_audio_file in set_paths_transcoding:
+								print_and_log(logging.WARNING,
+								              "Skipping \'%s\' as transcoded file \'%s\' is already lined up",
+								              entry.path, path_target_audio_file)
+
+								command = None
+
+							if command:
+								if count_jobs_pending_max and len(dict_future_job) >= count_jobs_pending_max:
+									futures_done, _ = concurrent.futures.wait(
+										dict_future_job, return_when = concurrent.futures.FIRST_COMPLETED)
+
+									for future in futures_done:
+										path_transcoded = transcode_future_aggregate(future, dict_future_job,
+										                                             dict_files_failed, stats)
+
+										if relocate and path_transcoded:
+											dict_dir_files_relocate.setdefault(os.path.dirname(path_transcoded),
+											                                   []).append(
+												(os.path.basename(path_transcoded), None))
+
+								dict_future_job[executor.submit(transcode_source_audio_worker,
+								                                (entry.path, path_target_audio_file,
+								                                 command))] = (entry.path, path_target_audio_file)
+								set_paths_transcoding.add(path_target_audio_file)
+								count_jobs += 1
+
+						# Pass on the size cached while listing the directory
+						if extension in extensions_relocate and entry.path not in set_paths_transcoding:
+							(dict_dir_files_relocate_after_transcode if command
+							 else dict_dir_files_relocate).setdefault(os.path.dirname(entry.path), []).append(
+								(entry.name, entry.stat().st_size))
+
+					thread_list.join()
+
+					# With the listing done, we know the total count of files to be transcoded to report the
+					# percentage of completion after every file
+					if percentage_show:
+						stats.count_transcode_queued = count_jobs
+
+					if relocate:
+						print_and_log(logging.INFO, "\nRelocating transcoded files to the destination \'%s\'...\n",
+						              dir_destination)
+
+						# Relocate what's at hand while the transcoders carry on
+						for dir_source, list_files in dict_dir_files_relocate.items():
+							for file_source, size_file in list_files:
+								build_target_and_operate(root_source, dir_source, file_source, dir_destination, target,
+								                         stats, size_file)
+
+					# Relocate the rest of the transcoded files as they turn up
+					for future in concurrent.futures.as_completed(dict_future_job):
+						path_transcoded = transcode_future_aggregate(future, dict_future_job, dict_files_failed, stats)
+
+						if relocate and path_transcoded:
+							build_target_and_operate(root_source, os.path.dirname(path_transcoded),
+							                         os.path.basename(path_transcoded), dir_destination, target, stats)
+				except BaseException:
+					# Leaving the pool waits on every job lined up, so Ctrl-C would not stop the run till
+					# the whole library is transcoded. Call off the jobs yet to run; the ones running
+					# give up their claims as their transcoders are interrupted along with us.
+					for future in dict_future_job:
+						future.cancel()
+
+					raise
+
+			for dir_source, list_files in dict_dir_files_relocate_after_transcode.items():
+				for file_source, size_file in list_files:
+					build_target_and_operate(root_source, dir_source, file_source, dir_destination, target, stats,
+					                         size_file)
+
+		if relocate:
 			# Ensure the originally received (unmodified) destination is passed
 			# for cleaning up empty directories created within the target path
 			delete_empty_directories_in_target(dir_destination_original)
 	else:
-		print("\aNo such target directory - \'" + dir_destination + "\'. Aborting.")
-		logging.error("No such target directory - \'" + dir_destination + "\'. Aborting.")
+		print_and_log(logging.ERROR, "No such target directory - \'%s\'. Aborting.", dir_destination, bell = True)
 
 		exit_code = 1
 
 	return exit_code
 
 
-def process_file(root_source, dir_destination, target, transcode, dict_files_failed):
+def process_file(root_source, dir_destination, target, transcode, dict_files_failed, stats):
 	# We got a file, move it to its appropriate destination
 	exit_code = 0
 
-	# Create, if the destination directory doesn't already exist.
-	if os.path.exists(dir_destination) or create_directory(dir_destination):
+	# Nothing to relocate if the file already is in the destination directory, as it is when
+	# no destination was specified
+	relocate = os.path.dirname(root_source) != dir_destination
+
+	# Nothing to do at all if the file isn't to be transcoded either
+	if not (transcode or relocate):
+		return exit_code
+
+	# Create, if the destination directory doesn't already exist. create_directory() doesn't
+	# check beforehand, but has mkdir() tell it. The file's own directory surely exists.
+	if not relocate or create_directory(dir_destination):
 		# Target head directory now exists; proceed
 
 		# If we were asked to transcode before relocation, oblige
 		if transcode:
-			transcoded_file = transcode_source_audio(root_source, target, transcode, None, dict_files_failed)
+			transcoded_file = transcode_source_audio(root_source, target, transcode, dict_files_failed, stats)
 
 			# If the transcoding was successful, or if we have
 			# a transcoded file from before, reassign the actual
@@ -689,87 +1175,81 @@ def process_file(root_source, dir_destination, target, transcode, dict_files_fai
 			if os.path.exists(transcoded_file):
 				root_source = transcoded_file
 
-		# Nothing to do if the source and destination directories are the same
-		if root_source != dir_destination:
-			print(
-				"\nRelocating transcoded file \'" + transcoded_file + "\' to the destination \'" + dir_destination + "\'...\n")
-			logging.info(
-				"\nRelocating transcoded file \'" + transcoded_file + "\' to the destination \'" + dir_destination + "\'...\n")
+		if relocate:
+			print_and_log(logging.INFO, "\nRelocating transcoded file \'%s\' to the destination \'%s\'...\n",
+			              root_source, dir_destination)
 
-			build_target_and_operate("", "", root_source, dir_destination, target)
+			build_target_and_operate("", os.path.dirname(root_source), os.path.basename(root_source), dir_destination,
+			                         target, stats)
 	else:
-		print("\aNo such target directory - \'" + dir_destination + "\'. Aborting.")
-		logging.error("No such target directory - \'" + dir_destination + "\'. Aborting.")
+		print_and_log(logging.ERROR, "No such target directory - \'%s\'. Aborting.", dir_destination, bell = True)
 
 		exit_code = 1
 
 	return exit_code
 
 
-def statistic_print(transcode, root_source, dir_destination, dict_files_failed):
+def statistic_print(transcode, root_source, dir_destination, dict_files_failed, stats):
 	if dict_files_failed:
-		count_failed_files = len(dict_files_failed.keys())
+		count_failed_files = len(dict_files_failed)
 
-		print("\n\aHere's a list of " + str(
-			count_failed_files) + " files that failed to transcode, with the reason below:\n")
-		logging.info("\nHere's a list of " + str(
-			count_failed_files) + " files that failed to transcode, with the reason below:\n")
+		print_and_log(logging.INFO, "\nHere's a list of %d files that failed to transcode, with the reason below:\n",
+		              count_failed_files, bell = True)
 
-		for key_file in dict_files_failed.keys():
-			print(key_file)
-			print("Reason for failure: " + dict_files_failed[key_file] + "\n")
-			logging.info(key_file)
-			logging.info("Reason for failure: " + dict_files_failed[key_file] + "\n")
+		# Report all of them in one go, rather than a few writes per file
+		print_and_log(logging.INFO, "\n".join(f"{file_failed}\nReason for failure: {reason_failure}\n"
+		                                      for file_failed, reason_failure in dict_files_failed.items()))
 
 	if transcode:
-		print(
-			"\nTotal time taken for successfully transcoding " + str(
-				transcode_source_audio.total_count_transcode) + " files: " + total_time_in_hms_get(
-				transcode_source_audio.total_time_ns_transcode) + "\n")
-		logging.info(
-			"\nTotal time taken for successfully transcoding " + str(
-				transcode_source_audio.total_count_transcode) + " files: " + total_time_in_hms_get(
-				transcode_source_audio.total_time_ns_transcode) + "\n")
+		print_and_log(logging.INFO, "\nTotal time taken for successfully transcoding %d files: %s\n",
+		              stats.count_transcoded, total_time_in_hms_get(stats.time_ns_transcode))
 
 	# We never moved files if the source and destination directories are the same, so no point
 	# reporting as well
 	if root_source != dir_destination:
-		# We only move transcoded files; other files relevant to the actual audio file are copied.
-		# So the total minus transcoded count will yield the copied count.
-		print("Moved (" + str(move_or_copy_file.total_count_moved) + ") and/or copied (" + str(
-			move_or_copy_file.total_count - move_or_copy_file.total_count_moved) + ") a total of " + sizeof_fmt(
-			move_or_copy_file.total_size) + " from " + str(
-			move_or_copy_file.total_count) + " files in " + total_time_in_hms_get(
-			build_target_and_operate.total_time_ns_relocate))
-		logging.info("Moved (" + str(move_or_copy_file.total_count_moved) + ") and/or copied (" + str(
-			move_or_copy_file.total_count - move_or_copy_file.total_count_moved) + ") a total of " + sizeof_fmt(
-			move_or_copy_file.total_size) + " from " + str(
-			move_or_copy_file.total_count) + " files in " + total_time_in_hms_get(
-			build_target_and_operate.total_time_ns_relocate))
+		# We only move transcoded files; other files relevant to the actual audio file are copied
+		count_moved = stats.count_moved
+		count_copied = stats.count_copied
+
+		print_and_log(logging.INFO, "Moved (%d) and/or copied (%d) a total of %s from %d files in %s", count_moved,
+		              count_copied, sizeof_fmt(stats.size_relocated), count_moved + count_copied,
+		              total_time_in_hms_get(stats.time_ns_relocate))
 
 
 # Check if the destination directory has write permission before we begin.
 # It's possible the user doesn't specify one, and the source being a read-only
 # disc. With the destination defaulting to the source, this is bound to cause
 # an exception!
+#
+# Rather than ask os.access(), which goes by the permission bits and can be wrong on
+# network filesystems and with ACLs, try creating (and deleting) a file in the directory.
+# Returns whether the directory is writable.
 def dir_access_write_check(dir_destination):
-	print("\nChecking for write access to the target directory \'" + dir_destination + "\'...")
-	logging.info("\nChecking for write access to the target directory \'" + dir_destination + "\'...")
+	print_and_log(logging.INFO, "\nChecking for write access to the target directory \'%s\'...", dir_destination)
+
+	path_probe = os.path.join(dir_destination, ".write_check." + str(os.getpid()))
 
-	if os.access(dir_destination, os.W_OK):
-		print("Write access for \'" + dir_destination + "\' seems available\n")
-		logging.info("Write access for \'" + dir_destination + "\' seems available\n")
+	try:
+		os.close(os.open(path_probe, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+		os.unlink(path_probe)
+	except OSError:
+		is_writable = False
+
+		print_and_log(logging.INFO,
+		              "The destination \'%s\' does not have write permission! Specify one with write access.",
+		              dir_destination, bell = True)
 	else:
-		print(
-			"\aThe destination \'" + dir_destination + "\' does not have write permission! Specify one with write access.")
-		logging.info(
-			"The destination \'" + dir_destination + "\' does not have write permission! Specify one with write access.")
+		is_writable = True
+
+		print_and_log(logging.INFO, "Write access for \'%s\' seems available\n", dir_destination)
+
+	return is_writable
 
 
-def dir_default_set(root_source):
+def dir_default_set(root_source, is_dir_source):
 	dir_destination = None
 
-	if os.path.isdir(root_source):
+	if is_dir_source:
 		# Set the default destination directory as the source directory
 		# itself. In all probability and commonness, this is what a user
 		# would prefer as default.
@@ -780,19 +1260,18 @@ def dir_default_set(root_source):
 	else:
 		dir_destination = os.path.dirname(root_source)
 
-	print("\nDestination not specified; defaulting to the source \'" + dir_destination + "\' itself")
-	logging.warning("\nDestination not specified; defaulting to the source \'" + dir_destination + "\' itself")
+	print_and_log(logging.WARNING, "\nDestination not specified; defaulting to the source \'%s\' itself", dir_destination)
 
 	return dir_destination
 
 
 def cwd_change(dir):
+	dir_working = os.path.dirname(os.path.abspath(dir))
+
 	# Change to the working directory of this Python script. Else, any dependencies will not be found.
-	os.chdir(os.path.dirname(os.path.abspath(dir)))
+	os.chdir(dir_working)
 
-	print("\nChanging working directory to \'" + os.path.dirname(os.path.abspath(dir)) + "\'...\n")
-	logging.info(
-		"\nChanging working directory to \'" + os.path.dirname(os.path.abspath(dir)) + "\'...\n")
+	print_and_log(logging.INFO, "\nChanging working directory to \'%s\'...\n", dir_working)
 
 
 def main(argv):
@@ -801,93 +1280,89 @@ def main(argv):
 	if is_supported_platform():
 		logging_init()
 
+		# A terminal line buffers the standard output, flushing on every line printed. Buffer
+		# it in blocks instead, and flush at points of progress. Whatever remains is flushed
+		# at exit.
+		sys.stdout.reconfigure(line_buffering = False)
+
 		opt_encode = "--encode-to"
 		opt_decode = "--decode-from"
 		opt_move_format = "--move-format"
 		opt_percentage = "--percentage-completion"
+		opt_jobs = "--jobs"
 
-		root_source, dir_destination, encode_to, decode_from, move_format, percentage_show = cmd_line_parse(opt_encode,
-		                                                                                                    opt_decode,
-		                                                                                                    opt_move_format,
-		                                                                                                    opt_percentage)
-
-		# Take the value for which one of the mutually exclusive options was passed in
-		target = encode_to if encode_to else (decode_from if decode_from else move_format)
+		root_source, dir_destination, transcode, target, percentage_show, jobs = cmd_line_parse(opt_encode, opt_decode,
+		                                                                                        opt_move_format,
+		                                                                                        opt_percentage, opt_jobs)
 
 		if target:
-			if move_format and percentage_show:
-				print("\aOption \'" + opt_percentage + "\' cannot be applied with option \'" + opt_move_format + "\'")
-				logging.info(
-					"Option \'" + opt_percentage + "\' cannot be applied with option \'" + opt_move_format + "\'")
+			# Merely moving files
+			if not transcode and percentage_show:
+				print_and_log(logging.INFO, "Option \'%s\' cannot be applied with option \'%s\'", opt_percentage,
+				              opt_move_format, bell = True)
+
+				exit_code = 1
+			elif jobs < 1:
+				print_and_log(logging.INFO, "Option \'%s\' needs to be at least 1", opt_jobs, bell = True)
 
 				exit_code = 1
 			else:
 				cwd_change(sys.argv[0])
 
+				# Make the paths absolute and normal once, resolved as they were so far against the
+				# working directory just changed to. Comparing them later on, and building paths
+				# under them, then holds without a trailing separator or the like tripping it up.
+				root_source = os.path.abspath(root_source)
+
+				if dir_destination:
+					dir_destination = os.path.abspath(dir_destination)
+
+				# Whether the source is a directory decides the default destination, and how the
+				# source is processed. Find out once.
+				is_dir_source = directory_exists(root_source)
+
 				# Check if the source drive/directory/file exists
-				if os.path.exists(root_source):
+				if is_dir_source or os.path.exists(root_source):
 					# Remove duplicates from the source path(s)
 					# root_source = [*set(root_source)]
 
 					dir_destination_original = dir_destination
 
-					if encode_to:
-						transcode = "encode"
-					elif decode_from:
-						transcode = "decode"
-					else:
-						transcode = None
-
 					# If the user did not specify the destination, set a default
 					if not dir_destination:
-						dir_destination = dir_default_set(root_source)
+						dir_destination = dir_default_set(root_source, is_dir_source)
 
 					dict_files_failed = {}
+					stats = RunStats()
 
 					# if dir_access_write_check(dir_destination):
 					# Check if we tripped on a directory
-					if os.path.isdir(root_source):
-						percentage_gather = False
-
-						if percentage_show:
-							# If we are to show a percentage of completion, we need to know how many files are
-							# to be transcoded in total
-							percentage_gather = True
-
-							# We don't care about the return value, as we're merely gathering a headcount of
-							# transcode-worthy source files
-							process_dir(root_source, dir_destination, dir_destination_original, target, transcode,
-							            percentage_gather, None)
-							# Gathering the count needs to be done only once, and was already done above
-							percentage_gather = False
-
-						# Now process the actual transcoding
-						if process_dir(root_source, dir_destination, dir_destination_original, target, transcode,
-						               percentage_gather, dict_files_failed):
+					if is_dir_source:
+						if process_dir(root_source, dir_destination, dir_destination_original, target, transcode, stats,
+						               jobs, percentage_show, dict_files_failed):
 							exit_code = 1
 					else:
 						# We tripped on a file
-						if process_file(root_source, dir_destination, target, transcode, dict_files_failed):
+						if process_file(root_source, dir_destination, target, transcode, dict_files_failed, stats):
 							exit_code = 1
 
-					statistic_print(transcode, root_source, dir_destination, dict_files_failed)
+					# Files are relocated from the directory of a single file passed
+					statistic_print(transcode, root_source if is_dir_source else os.path.dirname(root_source),
+					                dir_destination, dict_files_failed, stats)
 				# Slows down the script exit, so disabled for now
 				# show_toast("Transcode and/or Move Audio Files for Phone", "Done transcoding and/or moving files")
 				else:
-					print("\aNo such source directory/file to copy from - \'" + root_source + "\'. Aborting.")
-					logging.error("No such source directory/file to copy from - \'" + root_source + "\'. Aborting.")
+					print_and_log(logging.ERROR, "No such source directory/file to copy from - \'%s\'. Aborting.",
+					              root_source, bell = True)
 
 					exit_code = 1
 		else:
-			print(
-				"\aYou need to specify one of the options: " + opt_encode + "/" + opt_decode + "/" + opt_move_format + ", and its value")
-			logging.info(
-				"You need to specify one of the options: " + opt_encode + "/" + opt_decode + "/" + opt_move_format + ", and its value")
+			print_and_log(logging.INFO, "You need to specify one of the options: %s/%s/%s, and its value", opt_encode,
+			              opt_decode, opt_move_format, bell = True)
 
 			exit_code = 1
 	else:
-		print("\aUnsupported OS")
-		logging.error("Unsupported OS")
+		print_and_log(logging.ERROR, "Unsupported OS", bell = True)
 
 		exit_code = 1
 